@@ -0,0 +1,404 @@
+"""Shared state, nodes and graph factory for the long-running Athena query agent."""
+import os
+import time
+import asyncio
+import functools
+import logging
+import hashlib
+import operator
+from collections import OrderedDict
+from typing import Annotated, TypedDict, Literal
+from langgraph.graph import StateGraph, END
+from langgraph.types import Send
+from athena_mock import AthenaQuery, QueryStatus, BATCH_GET_MAX_IDS
+
+
+# Define the state (nodes return partial updates that LangGraph merges in)
+class AgentState(TypedDict):
+    sql_query: str
+    query_execution_id: str
+    athena_status: int
+    retry_count: int
+    max_retries: int
+    analysis_result: dict
+    error: str
+
+
+# State for running several queries at once; fan-out submissions append their IDs
+class BatchAgentState(TypedDict):
+    sql_queries: list[str]
+    query_execution_ids: Annotated[list[str], operator.add]
+    athena_statuses: list[int]
+    retry_count: int
+    max_retries: int
+    analysis_results: dict
+
+
+logger = logging.getLogger(__name__)
+
+# Initialize mock Athena client (in production, use real Athena client)
+athena_client = AthenaQuery()
+
+# How long each event-driven completion wait blocks before counting as a retry
+COMPLETION_WAIT_TIMEOUT = float(os.environ.get("COMPLETION_WAIT_TIMEOUT", "20"))
+
+# Polling backoff: start fast for short queries, cap the wait for long ones
+POLL_INITIAL_DELAY = float(os.environ.get("POLL_INITIAL_DELAY", "0.3"))
+POLL_BACKOFF_FACTOR = 1.25
+POLL_MAX_DELAY = float(os.environ.get("POLL_INTERVAL", "3"))
+
+
+def get_poll_delay(retry_count: int) -> float:
+    """Return the capped exponential backoff delay for the given poll attempt."""
+    return min(POLL_INITIAL_DELAY * (POLL_BACKOFF_FACTOR ** retry_count), POLL_MAX_DELAY)
+
+
+# In-process LRU cache of recent result summaries, keyed by whitespace-normalized SQL
+CACHED_QUERY_ID = "cached"
+RESULT_CACHE_MAX_AGE = float(os.environ.get("RESULT_CACHE_MAX_AGE", "3600"))
+RESULT_CACHE_MAX_SIZE = 128
+_result_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+
+def _result_cache_key(sql: str) -> str:
+    """Hash the SQL text into a cache key, collapsing whitespace but keeping case.
+    
+    Case is significant inside string literals ('Bob' vs 'bob'), so like
+    Athena result reuse the key otherwise matches the query text exactly.
+    """
+    return hashlib.sha256(" ".join(sql.split()).encode()).hexdigest()
+
+
+def get_cached_analysis(sql: str) -> dict | None:
+    """Return the cached analysis for the SQL if it is younger than RESULT_CACHE_MAX_AGE."""
+    key = _result_cache_key(sql)
+    entry = _result_cache.get(key)
+    if entry is None:
+        return None
+    
+    cached_at, analysis = entry
+    if time.time() - cached_at >= RESULT_CACHE_MAX_AGE:
+        del _result_cache[key]
+        return None
+    
+    _result_cache.move_to_end(key)
+    return analysis
+
+
+def cache_analysis(sql: str, analysis: dict) -> None:
+    """Store the analysis for the SQL, evicting the least recently used entry when full."""
+    key = _result_cache_key(sql)
+    _result_cache[key] = (time.time(), analysis)
+    _result_cache.move_to_end(key)
+    if len(_result_cache) > RESULT_CACHE_MAX_SIZE:
+        _result_cache.popitem(last=False)
+
+
+# Node A: Submit Athena Query
+def submit_athena_query(state: AgentState, sleep_seconds: int = 100) -> dict:
+    """Submit SQL query to Athena and store execution ID."""
+    logger.info("[Node A] Submitting query: %s", state["sql_query"])
+    
+    # Skip Athena entirely when a recent result for the same SQL exists; the
+    # analysis goes into state so fetch never depends on the entry surviving
+    analysis = get_cached_analysis(state["sql_query"])
+    if analysis is not None:
+        logger.info("[Node A] Reusing cached results")
+        return {
+            "query_execution_id": CACHED_QUERY_ID,
+            "athena_status": int(QueryStatus.SUCCEEDED),
+            "retry_count": 0,
+            "analysis_result": analysis
+        }
+    
+    # Start query execution (the mock finishes after sleep_seconds)
+    query_id = athena_client.ExecuteSQL(state["sql_query"], sleep_seconds=sleep_seconds)
+    
+    logger.info("[Node A] Query submitted with ID: %s", query_id)
+    
+    # Check status right away so fast queries skip the first backoff sleep
+    status = athena_client.get_query_status(query_id)
+    
+    return {
+        "query_execution_id": query_id,
+        "athena_status": int(status),
+        "retry_count": 0
+    }
+
+
+# Node B: Poll Athena Status
+def poll_athena_status(state: AgentState) -> dict:
+    """Check query execution status."""
+    query_id = state["query_execution_id"]
+    logger.debug("[Node B] Polling status for query: %s (attempt %d)", query_id, state["retry_count"] + 1)
+    
+    # Check status
+    status = athena_client.get_query_status(query_id)
+    
+    logger.debug("[Node B] Current status: %s", status.name)
+    
+    return {
+        "athena_status": int(status),
+        "retry_count": state["retry_count"] + 1
+    }
+
+
+async def poll_athena_status_async(state: AgentState) -> dict:
+    """Check query execution status without blocking the event loop."""
+    query_id = state["query_execution_id"]
+    logger.debug("[Node B] Polling status for query: %s (attempt %d)", query_id, state["retry_count"] + 1)
+    
+    # Check status
+    status = await athena_client.get_query_status_async(query_id)
+    
+    logger.debug("[Node B] Current status: %s", status.name)
+    
+    return {
+        "athena_status": int(status),
+        "retry_count": state["retry_count"] + 1
+    }
+
+
+# Node B (event-driven): Wait for Athena completion
+async def wait_for_athena_completion(state: AgentState) -> dict:
+    """Wait for the query's completion notification, up to COMPLETION_WAIT_TIMEOUT."""
+    query_id = state["query_execution_id"]
+    logger.debug("[Node B] Waiting for completion of query: %s (attempt %d)", query_id, state["retry_count"] + 1)
+    
+    # In production, long-poll the SQS queue fed by the Athena EventBridge rule
+    status = await athena_client.wait_for_completion(query_id, timeout=COMPLETION_WAIT_TIMEOUT)
+    
+    logger.debug("[Node B] Current status: %s", status.name)
+    
+    return {
+        "athena_status": int(status),
+        "retry_count": state["retry_count"] + 1
+    }
+
+
+def summarize_query_results(query_id: str) -> dict:
+    """Build an LLM-friendly summary; rows stay in S3 instead of being copied into state."""
+    # Count rows as they stream by rather than materializing them
+    row_count = sum(1 for _ in athena_client.get_query_results(query_id))
+    return {
+        "total_rows": row_count,
+        "summary": f"Retrieved {row_count} rows",
+        "s3_uri": athena_client.get_output_location(query_id)
+    }
+
+
+# Node C: Fetch Athena Results
+def fetch_athena_results(state: AgentState) -> dict:
+    """Retrieve and process query results."""
+    query_id = state["query_execution_id"]
+    logger.info("[Node C] Fetching results for query: %s", query_id)
+    
+    # Node A already put the cached analysis into state on a cache hit
+    if query_id == CACHED_QUERY_ID:
+        analysis = state["analysis_result"]
+    else:
+        analysis = summarize_query_results(query_id)
+        cache_analysis(state["sql_query"], analysis)
+    
+    logger.info("[Node C] Results fetched: %s", analysis["summary"])
+    
+    return {
+        "analysis_result": analysis
+    }
+
+
+# Conditional edge: Decide next step based on status
+def should_continue_polling(state: AgentState) -> Literal["fetch_results", "poll_status", "end"]:
+    """Route based on query status."""
+    status = state["athena_status"]
+    
+    if status == QueryStatus.SUCCEEDED:
+        return "fetch_results"
+    elif status == QueryStatus.FAILED:
+        return "end"
+    elif state["retry_count"] >= state["max_retries"]:
+        logger.warning("[Router] Max retries (%d) reached", state["max_retries"])
+        return "end"
+    else:
+        # Still running, back off and poll again
+        delay = get_poll_delay(state["retry_count"])
+        logger.debug("[Router] Query still running, waiting %.2f seconds...", delay)
+        time.sleep(delay)
+        return "poll_status"
+
+
+async def should_continue_polling_async(state: AgentState) -> Literal["fetch_results", "poll_status", "end"]:
+    """Route based on query status, yielding to the event loop while waiting."""
+    status = state["athena_status"]
+    
+    if status == QueryStatus.SUCCEEDED:
+        return "fetch_results"
+    elif status == QueryStatus.FAILED:
+        return "end"
+    elif state["retry_count"] >= state["max_retries"]:
+        logger.warning("[Router] Max retries (%d) reached", state["max_retries"])
+        return "end"
+    else:
+        # Still running, back off and poll again
+        delay = get_poll_delay(state["retry_count"])
+        logger.debug("[Router] Query still running, waiting %.2f seconds...", delay)
+        await asyncio.sleep(delay)
+        return "poll_status"
+
+
+def should_continue_waiting(state: AgentState) -> Literal["fetch_results", "wait_for_completion", "end"]:
+    """Route based on query status; the wait node blocks, so no sleep is needed here."""
+    status = state["athena_status"]
+    
+    if status == QueryStatus.SUCCEEDED:
+        return "fetch_results"
+    elif status == QueryStatus.FAILED:
+        return "end"
+    elif state["retry_count"] >= state["max_retries"]:
+        logger.warning("[Router] Max retries (%d) reached", state["max_retries"])
+        return "end"
+    else:
+        logger.debug("[Router] Query still running, waiting for completion again")
+        return "wait_for_completion"
+
+
+# Build the graph (compiled once per configuration and reused across invocations)
+def create_agent_graph(completion_mode: str = "poll", sleep_seconds: int = 100):
+    """Create LangGraph workflow for Athena query execution.
+    
+    completion_mode picks how the graph learns that the query finished:
+    "poll" checks status with blocking backoff sleeps (for invoke),
+    "async_poll" does the same without blocking the event loop, and
+    "events" waits for a completion notification (both for ainvoke).
+    sleep_seconds is how long the mock Athena query runs.
+    """
+    # Pass positionally so every spelling of the same configuration shares one cache entry
+    return _compile_agent_graph(completion_mode, sleep_seconds)
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_agent_graph(completion_mode: str, sleep_seconds: int):
+    """Compile the agent graph for one configuration (see create_agent_graph)."""
+    workflow = StateGraph(AgentState)
+    
+    if completion_mode == "events":
+        wait_node, wait_fn, router = "wait_for_completion", wait_for_athena_completion, should_continue_waiting
+    elif completion_mode == "async_poll":
+        wait_node, wait_fn, router = "poll_status", poll_athena_status_async, should_continue_polling_async
+    elif completion_mode == "poll":
+        wait_node, wait_fn, router = "poll_status", poll_athena_status, should_continue_polling
+    else:
+        raise ValueError(f"Unknown completion mode: {completion_mode}")
+    
+    # Add nodes
+    workflow.add_node("submit_query", functools.partial(submit_athena_query, sleep_seconds=sleep_seconds))
+    workflow.add_node(wait_node, wait_fn)
+    workflow.add_node("fetch_results", fetch_athena_results)
+    
+    # Define edges
+    workflow.set_entry_point("submit_query")
+    routes = {
+        "fetch_results": "fetch_results",
+        wait_node: wait_node,
+        "end": END
+    }
+    workflow.add_conditional_edges("submit_query", router, routes)
+    workflow.add_conditional_edges(wait_node, router, routes)
+    workflow.add_edge("fetch_results", END)
+    
+    return workflow.compile()
+
+
+# Batch workflow: fan out submissions, then poll every query with one call per tick
+def fan_out_queries(state: BatchAgentState) -> list[Send]:
+    """Send each SQL query to its own submission task."""
+    return [Send("submit_batch_query", {"sql_query": sql}) for sql in state["sql_queries"]]
+
+
+def submit_batch_query(state: dict, sleep_seconds: int = 100) -> dict:
+    """Submit one SQL query of a batch; the reducer collects the IDs."""
+    query_id = athena_client.ExecuteSQL(state["sql_query"], sleep_seconds=sleep_seconds)
+    logger.info("[Batch] Query submitted with ID: %s", query_id)
+    return {"query_execution_ids": [query_id]}
+
+
+def poll_batch_status(state: BatchAgentState) -> dict:
+    """Check every query in the batch, BATCH_GET_MAX_IDS per round-trip."""
+    query_ids = state["query_execution_ids"]
+    logger.debug("[Batch] Polling %d queries (attempt %d)", len(query_ids), state["retry_count"] + 1)
+    
+    statuses = []
+    for start in range(0, len(query_ids), BATCH_GET_MAX_IDS):
+        statuses.extend(athena_client.batch_get_query_status(query_ids[start:start + BATCH_GET_MAX_IDS]))
+    
+    return {
+        "athena_statuses": [int(status) for status in statuses],
+        "retry_count": state["retry_count"] + 1
+    }
+
+
+def fetch_batch_results(state: BatchAgentState) -> dict:
+    """Retrieve results for every succeeded query in the batch."""
+    analysis_results = {}
+    for query_id, status in zip(state["query_execution_ids"], state["athena_statuses"]):
+        if status != QueryStatus.SUCCEEDED:
+            continue
+        analysis_results[query_id] = summarize_query_results(query_id)
+    
+    logger.info("[Batch] Results fetched for %d queries", len(analysis_results))
+    
+    return {
+        "analysis_results": analysis_results
+    }
+
+
+def should_continue_batch_polling(state: BatchAgentState) -> Literal["fetch_results", "poll_status", "end"]:
+    """Route once no query is still running; one sleep serves the whole batch."""
+    statuses = state["athena_statuses"]
+    
+    if all(status != QueryStatus.RUNNING for status in statuses):
+        return "fetch_results"
+    elif state["retry_count"] >= state["max_retries"]:
+        logger.warning("[Router] Max retries (%d) reached", state["max_retries"])
+        return "end"
+    else:
+        delay = get_poll_delay(state["retry_count"])
+        logger.debug("[Router] %d queries still running, waiting %.2f seconds...",
+                     sum(status == QueryStatus.RUNNING for status in statuses), delay)
+        time.sleep(delay)
+        return "poll_status"
+
+
+def create_batch_agent_graph(sleep_seconds: int = 100):
+    """Create LangGraph workflow that runs several Athena queries concurrently.
+    
+    sleep_seconds is how long each mock Athena query runs.
+    """
+    return _compile_batch_agent_graph(sleep_seconds)
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_batch_agent_graph(sleep_seconds: int):
+    """Compile the batch graph for one mock query duration (see create_batch_agent_graph)."""
+    workflow = StateGraph(BatchAgentState)
+    
+    # Add nodes
+    workflow.add_node("submit_batch_query", functools.partial(submit_batch_query, sleep_seconds=sleep_seconds))
+    workflow.add_node("poll_status", poll_batch_status)
+    workflow.add_node("fetch_results", fetch_batch_results)
+    
+    # Define edges
+    workflow.set_conditional_entry_point(fan_out_queries, ["submit_batch_query"])
+    workflow.add_edge("submit_batch_query", "poll_status")
+    workflow.add_conditional_edges(
+        "poll_status",
+        should_continue_batch_polling,
+        {
+            "fetch_results": "fetch_results",
+            "poll_status": "poll_status",
+            "end": END
+        }
+    )
+    workflow.add_edge("fetch_results", END)
+    
+    return workflow.compile()
@@ -1,59 +1,195 @@
 """Mock Athena Query class that simulates long-running queries."""
+import asyncio
+import functools
+import itertools
+import os
+import threading
 import time
-import uuid
-from enum import Enum
+from collections.abc import Iterator
+from enum import IntEnum
 
+import numpy as np
 
-class QueryStatus(Enum):
-    RUNNING = "RUNNING"
-    SUCCEEDED = "SUCCEEDED"
-    FAILED = "FAILED"
+
+class QueryStatus(IntEnum):
+    RUNNING = 0
+    SUCCEEDED = 1
+    FAILED = 2
+
+
+# Status array holds the integer values; map them back without an enum lookup
+_STATUS_BY_CODE = tuple(QueryStatus)
+
+# Above this many queries, tick() uses the Numba kernel when numba is installed
+NUMBA_TICK_THRESHOLD = 10_000
+
+# Athena's BatchGetQueryExecution accepts at most this many IDs per call
+BATCH_GET_MAX_IDS = 50
+
+# Where the mock pretends Athena wrote each query's result CSV
+OUTPUT_LOCATION = "s3://mock-athena-results"
+
+# Shared, read-only result set returned for every completed query
+_MOCK_RESULTS = (
+    {"id": 1, "name": "Alice", "value": 100},
+    {"id": 2, "name": "Bob", "value": 200},
+    {"id": 3, "name": "Charlie", "value": 300}
+)
+
+_RUNNING_CODE = int(QueryStatus.RUNNING)
+_SUCCEEDED_CODE = int(QueryStatus.SUCCEEDED)
+
+
+@functools.lru_cache(maxsize=1)
+def _complete_due_kernel():
+    """Build the Numba tick() kernel on first use, or return None without numba.
+    
+    Importing numba costs noticeably more than the rest of this module, so it
+    only happens once a tick() actually crosses NUMBA_TICK_THRESHOLD.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:  # numba is optional; only large load tests benefit from it
+        return None
+    
+    @njit(parallel=True, cache=True)
+    def complete_due(deadline, status, now):
+        """Flip running queries whose deadline has passed to SUCCEEDED, in one fused parallel loop."""
+        for i in prange(deadline.shape[0]):
+            if status[i] == _RUNNING_CODE and deadline[i] <= now:
+                status[i] = _SUCCEEDED_CODE
+    
+    return complete_due
 
 
 class AthenaQuery:
-    """Mock Athena client that simulates query execution with sleep."""
+    """Mock Athena client that simulates query execution with sleep.
+    
+    Query state is kept as parallel NumPy arrays (monotonic deadline,
+    status) indexed by query ID, so tick() can roll every finished query
+    over to SUCCEEDED in one vectorized pass.
+    
+    Only ExecuteSQL takes a lock; status reads and SUCCEEDED flips stay
+    lock-free. A flip can land in an array _grow has just replaced and be
+    lost, so readers derive the status from the deadline rather than trust
+    the stored code alone; the stored flip is only a cache. Every completed
+    query serves the shared _MOCK_RESULTS, so there is no per-query result
+    to publish.
+    """
     
-    def __init__(self):
-        self.queries = {}
+    def __init__(self, capacity: int = 16):
+        self._deadline = np.empty(capacity, np.float64)
+        self._status = np.empty(capacity, np.uint8)
+        self._size = 0
+        self._idx: dict[str, int] = {}
+        self._sql: list[str] = []
+        # A counter beats uuid4; the random per-process prefix stops a restarted
+        # worker from handing a resumed checkpoint's ID to a different query
+        self._id_prefix = os.urandom(4).hex()
+        self._id_gen = itertools.count(1)
+        # Serializes appends so concurrent submissions never share a slot or race a resize
+        self._lock = threading.Lock()
+    
+    def _grow(self) -> None:
+        """Double the capacity of the per-query arrays."""
+        capacity = max(2 * self._deadline.shape[0], 1)
+        for name in ("_deadline", "_status"):
+            old = getattr(self, name)
+            new = np.empty(capacity, old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+    
+    def _index(self, query_id: str) -> int:
+        """Look up the array index for a query ID."""
+        i = self._idx.get(query_id)
+        if i is None:
+            raise ValueError(f"Query {query_id} not found")
+        return i
     
     def ExecuteSQL(self, sql: str, sleep_seconds: int = 5) -> str:
         """Start query execution and return execution ID."""
-        query_id = str(uuid.uuid4())
-        self.queries[query_id] = {
-            "sql": sql,
-            "status": QueryStatus.RUNNING,
-            "start_time": time.time(),
-            "sleep_duration": sleep_seconds,
-            "results": None
-        }
+        query_id = f"q{self._id_prefix}{next(self._id_gen):08x}"
+        with self._lock:
+            if self._size == self._deadline.shape[0]:
+                self._grow()
+            
+            i = self._size
+            self._deadline[i] = time.monotonic() + sleep_seconds
+            self._status[i] = QueryStatus.RUNNING
+            self._sql.append(sql)
+            self._size += 1
+            # Publish the ID last, once its slot is fully initialized
+            self._idx[query_id] = i
         return query_id
     
+    def tick(self) -> None:
+        """Complete every running query whose duration has elapsed."""
+        n = self._size
+        now = time.monotonic()
+        if n > NUMBA_TICK_THRESHOLD and (complete_due := _complete_due_kernel()) is not None:
+            complete_due(self._deadline[:n], self._status[:n], now)
+        else:
+            done = (self._status[:n] == QueryStatus.RUNNING) & (self._deadline[:n] <= now)
+            self._status[:n][done] = QueryStatus.SUCCEEDED
+    
     def get_query_status(self, query_id: str) -> QueryStatus:
-        """Check if query has completed (based on elapsed time)."""
-        if query_id not in self.queries:
-            raise ValueError(f"Query {query_id} not found")
+        """Check if query has completed (based on its monotonic deadline)."""
+        i = self._index(query_id)
+        
+        # Answer from the local value, not a re-read that a concurrent _grow could reset
+        status = self._status[i]
+        if status == QueryStatus.RUNNING and time.monotonic() >= self._deadline[i]:
+            status = self._status[i] = QueryStatus.SUCCEEDED
         
-        query = self.queries[query_id]
-        elapsed = time.time() - query["start_time"]
+        return _STATUS_BY_CODE[status]
+    
+    def batch_get_query_status(self, query_ids: list[str]) -> list[QueryStatus]:
+        """Check several queries in one call, like Athena's BatchGetQueryExecution."""
+        if len(query_ids) > BATCH_GET_MAX_IDS:
+            raise ValueError(f"At most {BATCH_GET_MAX_IDS} query IDs per batch, got {len(query_ids)}")
         
-        if elapsed >= query["sleep_duration"]:
-            query["status"] = QueryStatus.SUCCEEDED
-            # Generate mock results
-            query["results"] = [
-                {"id": 1, "name": "Alice", "value": 100},
-                {"id": 2, "name": "Bob", "value": 200},
-                {"id": 3, "name": "Charlie", "value": 300}
-            ]
+        idx = np.fromiter((self._index(q) for q in query_ids), dtype=np.intp, count=len(query_ids))
+        codes = self._status[idx]
+        due = (codes == QueryStatus.RUNNING) & (self._deadline[idx] <= time.monotonic())
+        codes[due] = QueryStatus.SUCCEEDED
+        self._status[idx[due]] = QueryStatus.SUCCEEDED
         
-        return query["status"]
+        return [_STATUS_BY_CODE[code] for code in codes]
     
-    def get_query_results(self, query_id: str) -> list:
-        """Retrieve query results."""
-        if query_id not in self.queries:
-            raise ValueError(f"Query {query_id} not found")
+    async def get_query_status_async(self, query_id: str) -> QueryStatus:
+        """Async variant of get_query_status (use aioboto3 get_query_execution in production)."""
+        await asyncio.sleep(0)
+        return self.get_query_status(query_id)
+    
+    async def wait_for_completion(self, query_id: str, timeout: float = 20) -> QueryStatus:
+        """Wait for the query's completion event, returning its status when it fires or on timeout.
+        
+        Stands in for long-polling an SQS queue subscribed to the EventBridge
+        "Athena Query State Change" rule (receive_message(WaitTimeSeconds=20)).
+        """
+        i = self._index(query_id)
         
-        query = self.queries[query_id]
-        if query["status"] != QueryStatus.SUCCEEDED:
+        if self._status[i] == QueryStatus.RUNNING:
+            completed = asyncio.Event()
+            delay = max(self._deadline[i] - time.monotonic(), 0.0)
+            handle = asyncio.get_running_loop().call_later(delay, completed.set)
+            try:
+                await asyncio.wait_for(completed.wait(), timeout)
+            except asyncio.TimeoutError:
+                handle.cancel()
+        
+        return self.get_query_status(query_id)
+    
+    def get_query_results(self, query_id: str) -> Iterator[dict]:
+        """Stream query results row by row (rows are a shared template; do not mutate)."""
+        if self.get_query_status(query_id) != QueryStatus.SUCCEEDED:
+            raise ValueError(f"Query {query_id} not yet completed")
+        
+        return iter(_MOCK_RESULTS)
+    
+    def get_output_location(self, query_id: str) -> str:
+        """Return the S3 URI of the query's result file."""
+        if self.get_query_status(query_id) != QueryStatus.SUCCEEDED:
             raise ValueError(f"Query {query_id} not yet completed")
         
-        return query["results"]
+        return f"{OUTPUT_LOCATION}/{query_id}.csv"
@@ -0,0 +1,12 @@
+"""Shared pytest fixtures for the agent test suites."""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _fast_sleep(request, monkeypatch):
+    """Make time.sleep a no-op so graph tests skip the polling router's backoff delays.
+    
+    Tests marked real_sleep keep the real time.sleep.
+    """
+    if request.node.get_closest_marker("real_sleep") is None:
+        monkeypatch.setattr("time.sleep", lambda seconds: None)
@@ -1,32 +1,30 @@
 """Example script for invoking the deployed AgentCore agent programmatically."""
-import json
+import asyncio
 import uuid
-import boto3
+import aioboto3
+import orjson
 import sys
 
 # Configuration
 AGENT_ARN = "arn:aws:bedrock-agentcore:us-west-2:175918693907:runtime/longrunning_langraph_agent-7Z3Fu233jt"  # Get this from agentcore launch output
 AWS_REGION = "us-west-2"
 
-def invoke_agent(sql_query: str, max_retries: int = 20):
+async def invoke_agent(sql_query: str, max_retries: int = 20):
     """
-    Invoke the deployed Athena query agent.
+    Invoke the deployed Athena query agent without blocking other invocations.
     
     Args:
         sql_query: SQL query to execute
-        max_retries: Maximum number of polling attempts
+        max_retries: Maximum number of status checks; in events mode each can wait up to COMPLETION_WAIT_TIMEOUT seconds
     
     Returns:
         dict: Agent response with query results
     """
-    # Initialize the AgentCore client
-    client = boto3.client('bedrock-agentcore', region_name=AWS_REGION)
-    
     # Prepare the payload
-    payload = json.dumps({
+    payload = orjson.dumps({
         "sql_query": sql_query,
         "max_retries": max_retries
-    }).encode()
+    })
     
     # Generate a unique session ID
     session_id = str(uuid.uuid4())
@@ -36,34 +34,33 @@ def invoke_agent(sql_query: str, max_retries: int = 20):
     print("-" * 60)
     
     try:
-        # Invoke the agent
-        response = client.invoke_agent_runtime(
-            agentRuntimeArn=AGENT_ARN,
-            runtimeSessionId=session_id,
-            payload=payload,
-            qualifier="DEFAULT"
-        )
-        
-        # Process the streaming response
-        content = []
-        for chunk in response.get("response", []):
-            content.append(chunk.decode('utf-8'))
+        # Initialize the AgentCore client and invoke the agent
+        async with aioboto3.Session().client('bedrock-agentcore', region_name=AWS_REGION) as client:
+            response = await client.invoke_agent_runtime(
+                agentRuntimeArn=AGENT_ARN,
+                runtimeSessionId=session_id,
+                payload=payload,
+                qualifier="DEFAULT"
+            )
+            
+            # Read the streaming response
+            content = await response["response"].read()
         
         # Parse the result
-        result = json.loads(''.join(content))
+        result = orjson.loads(content)
         
-        print("Agent Response:")
-        print(json.dumps(result, indent=2))
+        print(f"Agent Response (session {session_id}):")
+        print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
         
         return result
         
     except Exception as e:
-        print(f"Error invoking agent: {str(e)}")
+        print(f"Error invoking agent (session {session_id}): {str(e)}")
         raise
 
 
-def main():
-    """Main function with example invocations."""
+async def main():
+    """Main function with example invocations, run concurrently."""
     
     # Check if agent ARN is configured
     if AGENT_ARN == "REPLACE_WITH_YOUR_AGENT_ARN":
@@ -71,32 +68,30 @@ def main():
         print("Get the ARN from the output of: agentcore launch")
         sys.exit(1)
     
-    # Example 1: Simple query
     print("\n" + "=" * 60)
-    print("Example 1: Simple Query")
+    print("Running 3 example queries concurrently")
     print("=" * 60)
-    invoke_agent("SELECT * FROM users WHERE active = true")
     
-    # Example 2: Query with custom max retries
-    print("\n" + "=" * 60)
-    print("Example 2: Query with Custom Max Retries")
-    print("=" * 60)
-    invoke_agent("SELECT * FROM orders WHERE date > '2024-01-01'", max_retries=15)
+    tasks = [
+        # Example 1: Simple query
+        invoke_agent("SELECT * FROM users WHERE active = true"),
+        # Example 2: Query with custom max retries
+        invoke_agent("SELECT * FROM orders WHERE date > '2024-01-01'", max_retries=15),
+        # Example 3: Complex query
+        invoke_agent("""
+            SELECT 
+                user_id, 
+                COUNT(*) as order_count,
+                SUM(total) as total_spent
+            FROM orders
+            GROUP BY user_id
+            HAVING total_spent > 1000
+        """),
+    ]
     
-    # Example 3: Complex query
-    print("\n" + "=" * 60)
-    print("Example 3: Complex Query")
-    print("=" * 60)
-    invoke_agent("""
-        SELECT 
-            user_id, 
-            COUNT(*) as order_count,
-            SUM(total) as total_spent
-        FROM orders
-        GROUP BY user_id
-        HAVING total_spent > 1000
-    """)
+    # Total latency is the slowest query instead of the sum of all three
+    return await asyncio.gather(*tasks)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -1,16 +1,24 @@
 """Tests for the LangGraph Athena agent."""
+import asyncio
 import pytest
 from unittest.mock import Mock, patch
 from athena_mock import AthenaQuery, QueryStatus
-from agent import (
+from agent_core import (
     submit_athena_query,
     poll_athena_status,
     fetch_athena_results,
     should_continue_polling,
-    create_agent_graph
+    get_poll_delay,
+    cache_analysis,
+    get_cached_analysis,
+    create_agent_graph,
+    poll_batch_status,
+    create_batch_agent_graph
 )
+import agent_core
 
 
+@pytest.mark.real_sleep
 class TestAthenaQuery:
     """Tests for the mock Athena client."""
     
@@ -21,6 +29,7 @@ class TestAthenaQuery:
         assert query_id is not None
         assert isinstance(query_id, str)
         assert len(query_id) > 0
+        assert client.ExecuteSQL("SELECT * FROM test", sleep_seconds=1) != query_id
     
     def test_query_status_initially_running(self):
         """Test that query status is initially RUNNING."""
@@ -41,21 +50,94 @@ class TestAthenaQuery:
         client = AthenaQuery()
         query_id = client.ExecuteSQL("SELECT * FROM test", sleep_seconds=0)
         client.get_query_status(query_id)  # Trigger completion
-        results = client.get_query_results(query_id)
-        assert isinstance(results, list)
+        results = list(client.get_query_results(query_id))
         assert len(results) == 3
         assert results[0]["name"] == "Alice"
+        assert client.get_output_location(query_id) == f"s3://mock-athena-results/{query_id}.csv"
+    
+    def test_tick_completes_elapsed_queries(self):
+        """Test that tick() rolls over only queries whose duration has elapsed."""
+        client = AthenaQuery(capacity=1)
+        done_ids = [client.ExecuteSQL("SELECT 1", sleep_seconds=0) for _ in range(3)]
+        running_id = client.ExecuteSQL("SELECT 2", sleep_seconds=60)
+        client.tick()
+        for query_id in done_ids:
+            assert len(list(client.get_query_results(query_id))) == 3
+        assert client.get_query_status(running_id) == QueryStatus.RUNNING
+    
+    def test_wait_for_completion(self):
+        """Test that waiting returns once the query completes or the wait times out."""
+        client = AthenaQuery()
+        fast_id = client.ExecuteSQL("SELECT * FROM test", sleep_seconds=0.01)
+        slow_id = client.ExecuteSQL("SELECT * FROM test", sleep_seconds=60)
+        assert asyncio.run(client.wait_for_completion(fast_id, timeout=5)) == QueryStatus.SUCCEEDED
+        assert asyncio.run(client.wait_for_completion(slow_id, timeout=0.01)) == QueryStatus.RUNNING
+    
+    def test_tick_numba_kernel_matches_numpy(self):
+        """Test that the optional Numba tick completes the same queries."""
+        pytest.importorskip("numba")
+        import athena_mock
+        assert athena_mock._complete_due_kernel() is not None
+        
+        client = AthenaQuery()
+        done_ids = [client.ExecuteSQL("SELECT 1", sleep_seconds=0) for _ in range(5)]
+        running_id = client.ExecuteSQL("SELECT 2", sleep_seconds=60)
+        with patch.object(athena_mock, "NUMBA_TICK_THRESHOLD", 0):
+            client.tick()
+        assert all(client._status[client._idx[q]] == QueryStatus.SUCCEEDED for q in done_ids)
+        assert client._status[client._idx[running_id]] == QueryStatus.RUNNING
+    
+    def test_batch_get_query_status(self):
+        """Test that one batch call reports every query's status."""
+        client = AthenaQuery()
+        done_id = client.ExecuteSQL("SELECT 1", sleep_seconds=0)
+        running_id = client.ExecuteSQL("SELECT 2", sleep_seconds=60)
+        statuses = client.batch_get_query_status([done_id, running_id])
+        assert statuses == [QueryStatus.SUCCEEDED, QueryStatus.RUNNING]
+        with pytest.raises(ValueError):
+            client.batch_get_query_status([done_id] * 51)
+    
+    def test_concurrent_submissions_get_distinct_slots(self):
+        """Test that ExecuteSQL from many threads keeps every query addressable."""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        client = AthenaQuery(capacity=1)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            query_ids = list(pool.map(lambda _: client.ExecuteSQL("SELECT 1", sleep_seconds=0), range(200)))
+        
+        assert len(set(query_ids)) == 200
+        assert all(client.get_query_status(q) == QueryStatus.SUCCEEDED for q in query_ids)
+    
+    def test_results_survive_a_lost_status_flip(self):
+        """Test that a SUCCEEDED flip lost to a concurrent _grow cannot make results raise."""
+        client = AthenaQuery()
+        query_id = client.ExecuteSQL("SELECT * FROM test", sleep_seconds=0)
+        assert client.get_query_status(query_id) == QueryStatus.SUCCEEDED
+        # Simulate the flip having been written into the array _grow replaced
+        client._status[client._idx[query_id]] = QueryStatus.RUNNING
+        assert len(list(client.get_query_results(query_id))) == 3
+        assert client.batch_get_query_status([query_id]) == [QueryStatus.SUCCEEDED]
+    
+    def test_get_query_status_async(self):
+        """Test that the async status check matches the sync one."""
+        client = AthenaQuery()
+        query_id = client.ExecuteSQL("SELECT * FROM test", sleep_seconds=0)
+        status = asyncio.run(client.get_query_status_async(query_id))
+        assert status == QueryStatus.SUCCEEDED
 
 
 class TestAgentNodes:
     """Tests for individual agent nodes."""
     
+    def setup_method(self):
+        agent_core._result_cache.clear()
+    
     def test_submit_athena_query_node(self):
         """Test Node A: submit_athena_query."""
         initial_state = {
             "sql_query": "SELECT * FROM users",
             "query_execution_id": "",
-            "athena_status": "",
+            "athena_status": QueryStatus.RUNNING,
             "retry_count": 0,
             "max_retries": 10,
             "analysis_result": {},
@@ -65,10 +147,32 @@ class TestAgentNodes:
         result = submit_athena_query(initial_state)
         
         assert result["query_execution_id"] != ""
-        assert result["athena_status"] == "RUNNING"
+        assert result["athena_status"] == QueryStatus.RUNNING
         assert result["retry_count"] == 0
     
-    @patch('agent.athena_client')
+    @patch('agent_core.athena_client')
+    def test_submit_athena_query_checks_status_inline(self, mock_client):
+        """Test Node A reports a query that finished during submission."""
+        mock_client.ExecuteSQL.return_value = "test-query-id"
+        mock_client.get_query_status.return_value = QueryStatus.SUCCEEDED
+        
+        state = {
+            "sql_query": "SELECT * FROM users",
+            "query_execution_id": "",
+            "athena_status": QueryStatus.RUNNING,
+            "retry_count": 0,
+            "max_retries": 10,
+            "analysis_result": {},
+            "error": ""
+        }
+        
+        result = submit_athena_query(state)
+        
+        assert result["athena_status"] == QueryStatus.SUCCEEDED
+        assert should_continue_polling({**state, **result}) == "fetch_results"
+        mock_client.get_query_status.assert_called_once_with("test-query-id")
+    
+    @patch('agent_core.athena_client')
     def test_poll_athena_status_node(self, mock_client):
         """Test Node B: poll_athena_status."""
         mock_client.get_query_status.return_value = QueryStatus.SUCCEEDED
@@ -76,7 +180,7 @@ class TestAgentNodes:
         state = {
             "sql_query": "SELECT * FROM test",
             "query_execution_id": "test-query-id",
-            "athena_status": "RUNNING",
+            "athena_status": QueryStatus.RUNNING,
             "retry_count": 0,
             "max_retries": 10,
             "analysis_result": {},
@@ -85,20 +189,24 @@ class TestAgentNodes:
         
         result = poll_athena_status(state)
         
-        assert result["athena_status"] == "SUCCEEDED"
+        assert result["athena_status"] == QueryStatus.SUCCEEDED
+        assert type(result["athena_status"]) is int
         assert result["retry_count"] == 1
+        # Nodes return only the fields they change
+        assert set(result) == {"athena_status", "retry_count"}
         mock_client.get_query_status.assert_called_once_with("test-query-id")
     
-    @patch('agent.athena_client')
+    @patch('agent_core.athena_client')
     def test_fetch_athena_results_node(self, mock_client):
         """Test Node C: fetch_athena_results."""
         mock_results = [{"id": 1, "name": "Test"}]
-        mock_client.get_query_results.return_value = mock_results
+        mock_client.get_query_results.return_value = iter(mock_results)
+        mock_client.get_output_location.return_value = "s3://bucket/test-query-id.csv"
         
         state = {
             "sql_query": "SELECT * FROM test",
             "query_execution_id": "test-query-id",
-            "athena_status": "SUCCEEDED",
+            "athena_status": QueryStatus.SUCCEEDED,
             "retry_count": 1,
             "max_retries": 10,
             "analysis_result": {},
@@ -109,8 +217,72 @@ class TestAgentNodes:
         
         assert "analysis_result" in result
         assert result["analysis_result"]["total_rows"] == 1
-        assert "data" in result["analysis_result"]
+        assert result["analysis_result"]["s3_uri"] == "s3://bucket/test-query-id.csv"
+        # Rows stay in S3 rather than being copied into state
+        assert "data" not in result["analysis_result"]
         mock_client.get_query_results.assert_called_once_with("test-query-id")
+    
+    @patch('agent_core.athena_client')
+    def test_submit_athena_query_uses_cache(self, mock_client):
+        """Test Node A short-circuits Athena when results are cached."""
+        cached = {"total_rows": 1, "summary": "Retrieved 1 rows", "s3_uri": "s3://bucket/cached.csv"}
+        cache_analysis("SELECT * FROM users", cached)
+        
+        state = {
+            "sql_query": "  SELECT *\n  FROM users ",
+            "query_execution_id": "",
+            "athena_status": QueryStatus.RUNNING,
+            "retry_count": 0,
+            "max_retries": 10,
+            "analysis_result": {},
+            "error": ""
+        }
+        
+        result = submit_athena_query(state)
+        
+        assert result["query_execution_id"] == "cached"
+        assert result["athena_status"] == QueryStatus.SUCCEEDED
+        mock_client.ExecuteSQL.assert_not_called()
+        
+        result = fetch_athena_results({**state, **result})
+        
+        assert result["analysis_result"] == cached
+        mock_client.get_query_results.assert_not_called()
+    
+    @patch('agent_core.athena_client')
+    def test_cache_hit_survives_eviction_before_fetch(self, mock_client):
+        """Test Node C still has the analysis when the cache entry is gone by fetch time."""
+        cached = {"total_rows": 1, "summary": "Retrieved 1 rows", "s3_uri": "s3://bucket/cached.csv"}
+        cache_analysis("SELECT * FROM users", cached)
+        
+        state = {
+            "sql_query": "SELECT * FROM users",
+            "query_execution_id": "",
+            "athena_status": QueryStatus.RUNNING,
+            "retry_count": 0,
+            "max_retries": 10,
+            "analysis_result": {},
+            "error": ""
+        }
+        
+        result = submit_athena_query(state)
+        # Expired, evicted or lost to a restart before Node C runs
+        agent_core._result_cache.clear()
+        result = fetch_athena_results({**state, **result})
+        
+        assert result["analysis_result"] == cached
+        mock_client.get_query_results.assert_not_called()
+    
+    def test_cache_key_keeps_case(self):
+        """Test that queries differing only in literal case do not share an entry."""
+        cache_analysis("SELECT * FROM users WHERE name = 'Bob'", {"total_rows": 1})
+        assert get_cached_analysis("SELECT * FROM users WHERE name = 'bob'") is None
+    
+    def test_cached_results_expire(self):
+        """Test that stale cache entries are ignored."""
+        cache_analysis("SELECT 1", {"total_rows": 1})
+        with patch.object(agent_core, "RESULT_CACHE_MAX_AGE", 0):
+            assert get_cached_analysis("SELECT 1") is None
 
 
 class TestConditionalRouting:
@@ -119,7 +291,7 @@ class TestConditionalRouting:
     def test_should_continue_polling_on_success(self):
         """Test routing when query succeeds."""
         state = {
-            "athena_status": "SUCCEEDED",
+            "athena_status": QueryStatus.SUCCEEDED,
             "retry_count": 2,
             "max_retries": 10
         }
@@ -130,7 +302,7 @@ class TestConditionalRouting:
     def test_should_continue_polling_on_failure(self):
         """Test routing when query fails."""
         state = {
-            "athena_status": "FAILED",
+            "athena_status": QueryStatus.FAILED,
             "retry_count": 2,
             "max_retries": 10
         }
@@ -141,7 +313,7 @@ class TestConditionalRouting:
     def test_should_continue_polling_on_max_retries(self):
         """Test routing when max retries reached."""
         state = {
-            "athena_status": "RUNNING",
+            "athena_status": QueryStatus.RUNNING,
             "retry_count": 10,
             "max_retries": 10
         }
@@ -153,32 +325,50 @@ class TestConditionalRouting:
     def test_should_continue_polling_on_running(self, mock_sleep):
         """Test routing when query still running."""
         state = {
-            "athena_status": "RUNNING",
+            "athena_status": QueryStatus.RUNNING,
             "retry_count": 2,
             "max_retries": 10
         }
         
         result = should_continue_polling(state)
         assert result == "poll_status"
-        mock_sleep.assert_called_once_with(2)
+        mock_sleep.assert_called_once_with(pytest.approx(0.3 * 1.25 ** 2))
+    
+    def test_poll_delay_backoff_is_capped(self):
+        """Test that the polling delay grows exponentially up to the cap."""
+        assert get_poll_delay(0) == pytest.approx(0.3)
+        assert get_poll_delay(1) == pytest.approx(0.375)
+        assert get_poll_delay(50) == 3.0
 
 
 class TestAgentGraph:
     """Integration tests for the complete agent graph."""
     
+    def setup_method(self):
+        agent_core._result_cache.clear()
+    
     def test_create_agent_graph(self):
         """Test that agent graph is created successfully."""
         graph = create_agent_graph()
         assert graph is not None
+        # Compiled once and reused, however the defaults are spelled
+        assert create_agent_graph() is graph
+        assert create_agent_graph("poll", 100) is graph
+        assert create_agent_graph(completion_mode="poll", sleep_seconds=100) is graph
     
-    def test_agent_graph_execution_success(self):
+    @pytest.mark.parametrize("rows", [
+        [{"id": 1, "name": "Test"}],
+        [{"id": i, "name": f"Test {i}"} for i in range(3)],
+        [],
+    ], ids=["one_row", "many_rows", "no_rows"])
+    def test_agent_graph_execution_success(self, rows):
         """Test complete agent execution with successful query."""
         graph = create_agent_graph()
         
         initial_state = {
             "sql_query": "SELECT * FROM users WHERE active = true",
             "query_execution_id": "",
-            "athena_status": "",
+            "athena_status": QueryStatus.RUNNING,
             "retry_count": 0,
             "max_retries": 10,
             "analysis_result": {},
@@ -192,13 +382,56 @@ class TestAgentGraph:
             with patch.object(AthenaQuery, 'get_query_status') as mock_status:
                 mock_status.return_value = QueryStatus.SUCCEEDED
                 
-                with patch.object(AthenaQuery, 'get_query_results') as mock_results:
-                    mock_results.return_value = [{"id": 1, "name": "Test"}]
+                with patch.object(AthenaQuery, 'get_query_results') as mock_results, \
+                        patch.object(AthenaQuery, 'get_output_location') as mock_location:
+                    mock_results.return_value = iter(rows)
+                    mock_location.return_value = "s3://bucket/test-query-id.csv"
                     
                     final_state = graph.invoke(initial_state)
                     
-                    assert final_state["athena_status"] == "SUCCEEDED"
-                    assert final_state["analysis_result"]["total_rows"] == 1
+                    assert final_state["athena_status"] == QueryStatus.SUCCEEDED
+                    assert final_state["analysis_result"]["total_rows"] == len(rows)
+                    # Finished at submission, so no poll was needed
+                    assert final_state["retry_count"] == 0
+
+
+class TestBatchAgentGraph:
+    """Tests for the multi-query batch workflow."""
+    
+    @patch('agent_core.athena_client')
+    def test_poll_batch_status_chunks_ids(self, mock_client):
+        """Test that polling issues one batch call per 50 IDs."""
+        mock_client.batch_get_query_status.side_effect = lambda ids: [QueryStatus.RUNNING] * len(ids)
+        state = {"query_execution_ids": [f"q{i}" for i in range(60)], "retry_count": 0}
+        
+        result = poll_batch_status(state)
+        
+        assert len(result["athena_statuses"]) == 60
+        assert result["retry_count"] == 1
+        assert mock_client.batch_get_query_status.call_count == 2
+    
+    @patch('agent_core.athena_client')
+    def test_batch_graph_execution_success(self, mock_client):
+        """Test fan-out submission, batched polling and fan-in of results."""
+        mock_client.ExecuteSQL.side_effect = lambda sql, sleep_seconds: f"id-{sql}"
+        mock_client.batch_get_query_status.side_effect = lambda ids: [QueryStatus.SUCCEEDED] * len(ids)
+        mock_client.get_query_results.side_effect = lambda query_id: iter([{"id": 1, "name": "Test"}])
+        mock_client.get_output_location.side_effect = lambda query_id: f"s3://bucket/{query_id}.csv"
+        
+        final_state = create_batch_agent_graph(sleep_seconds=7).invoke({
+            "sql_queries": ["SELECT 1", "SELECT 2"],
+            "query_execution_ids": [],
+            "athena_statuses": [],
+            "retry_count": 0,
+            "max_retries": 10,
+            "analysis_results": {}
+        })
+        
+        assert sorted(final_state["query_execution_ids"]) == ["id-SELECT 1", "id-SELECT 2"]
+        assert final_state["retry_count"] == 1
+        assert set(final_state["analysis_results"]) == {"id-SELECT 1", "id-SELECT 2"}
+        mock_client.batch_get_query_status.assert_called_once()
+        assert all(call.kwargs["sleep_seconds"] == 7 for call in mock_client.ExecuteSQL.call_args_list)
 
 
 if __name__ == "__main__":
@@ -1,26 +1,42 @@
 """Tests for the AgentCore-compatible agent wrapper."""
+import asyncio
 import pytest
-from unittest.mock import Mock, patch, MagicMock
-from agentcore_agent import invoke, create_agent_graph
+from unittest.mock import Mock, patch, MagicMock, AsyncMock
+from athena_mock import QueryStatus
+import orjson
+from agentcore_agent import invoke, entrypoint, create_agent_graph
+
+
+def _graph_mock():
+    """Mock graph whose copy() (used to attach the checkpointer) returns itself."""
+    graph = AsyncMock()
+    graph.copy = Mock(return_value=graph)
+    return graph
+
+
+@pytest.fixture(autouse=True)
+def _checkpoint_db(monkeypatch, tmp_path):
+    """Keep each test's checkpoints in its own temporary SQLite file."""
+    monkeypatch.setattr("agentcore_agent.CHECKPOINT_DB", str(tmp_path / "checkpoints.db"))
 
 
 class TestAgentCoreWrapper:
     """Tests for the AgentCore entrypoint."""
     
-    @patch('agentcore_agent.graph')
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
     def test_invoke_with_sql_query(self, mock_graph):
         """Test invoke with explicit SQL query."""
         # Mock the graph execution
-        mock_graph.invoke.return_value = {
+        mock_graph.ainvoke.return_value = {
             "sql_query": "SELECT * FROM users",
             "query_execution_id": "test-id",
-            "athena_status": "SUCCEEDED",
+            "athena_status": QueryStatus.SUCCEEDED,
             "retry_count": 3,
             "max_retries": 10,
             "analysis_result": {
                 "total_rows": 5,
                 "summary": "Retrieved 5 rows",
-                "data": [{"id": 1, "name": "Test"}]
+                "s3_uri": "s3://bucket/test-id.csv"
             },
             "error": ""
         }
@@ -30,44 +46,44 @@ class TestAgentCoreWrapper:
             "max_retries": 10
         }
         
-        result = invoke(payload)
+        result = asyncio.run(invoke(payload))
         
         assert result["status"] == "success"
         assert result["query_id"] == "test-id"
         assert result["polls"] == 3
         assert result["result"]["total_rows"] == 5
     
-    @patch('agentcore_agent.graph')
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
     def test_invoke_with_prompt(self, mock_graph):
         """Test invoke with prompt instead of sql_query."""
-        mock_graph.invoke.return_value = {
+        mock_graph.ainvoke.return_value = {
             "sql_query": "SELECT * FROM users LIMIT 10",
             "query_execution_id": "test-id",
-            "athena_status": "SUCCEEDED",
+            "athena_status": QueryStatus.SUCCEEDED,
             "retry_count": 2,
             "max_retries": 20,
             "analysis_result": {
                 "total_rows": 10,
                 "summary": "Retrieved 10 rows",
-                "data": []
+                "s3_uri": "s3://bucket/test-id.csv"
             },
             "error": ""
         }
         
         payload = {"prompt": "Run a query"}
         
-        result = invoke(payload)
+        result = asyncio.run(invoke(payload))
         
         assert result["status"] == "success"
         assert "result" in result
     
-    @patch('agentcore_agent.graph')
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
     def test_invoke_query_failed(self, mock_graph):
         """Test invoke when query fails."""
-        mock_graph.invoke.return_value = {
+        mock_graph.ainvoke.return_value = {
             "sql_query": "SELECT * FROM invalid_table",
             "query_execution_id": "test-id",
-            "athena_status": "FAILED",
+            "athena_status": QueryStatus.FAILED,
             "retry_count": 1,
             "max_retries": 10,
             "analysis_result": {},
@@ -76,18 +92,18 @@ class TestAgentCoreWrapper:
         
         payload = {"sql_query": "SELECT * FROM invalid_table"}
         
-        result = invoke(payload)
+        result = asyncio.run(invoke(payload))
         
         assert result["status"] == "failed"
         assert "error" in result
     
-    @patch('agentcore_agent.graph')
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
     def test_invoke_query_timeout(self, mock_graph):
         """Test invoke when query times out."""
-        mock_graph.invoke.return_value = {
+        mock_graph.ainvoke.return_value = {
             "sql_query": "SELECT * FROM large_table",
             "query_execution_id": "test-id",
-            "athena_status": "RUNNING",
+            "athena_status": QueryStatus.RUNNING,
             "retry_count": 10,
             "max_retries": 10,
             "analysis_result": {},
@@ -99,78 +115,199 @@ class TestAgentCoreWrapper:
             "max_retries": 10
         }
         
-        result = invoke(payload)
+        result = asyncio.run(invoke(payload))
         
         assert result["status"] == "timeout"
         assert "error" in result
         assert result["polls"] == 10
     
-    @patch('agentcore_agent.graph')
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
     def test_invoke_exception_handling(self, mock_graph):
         """Test invoke handles exceptions gracefully."""
-        mock_graph.invoke.side_effect = Exception("Test error")
+        mock_graph.ainvoke.side_effect = Exception("Test error")
         
         payload = {"sql_query": "SELECT * FROM users"}
         
-        result = invoke(payload)
+        result = asyncio.run(invoke(payload))
         
         assert result["status"] == "error"
         assert "Test error" in result["error"]
     
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
+    def test_invoke_resume_from_checkpoint(self, mock_graph):
+        """Test resume continues the session's checkpoint instead of restarting."""
+        mock_graph.ainvoke.return_value = {
+            "sql_query": "SELECT * FROM users",
+            "query_execution_id": "test-id",
+            "athena_status": QueryStatus.SUCCEEDED,
+            "retry_count": 4,
+            "max_retries": 10,
+            "analysis_result": {"total_rows": 1, "summary": "Retrieved 1 rows", "s3_uri": "s3://bucket/test-id.csv"},
+            "error": ""
+        }
+        context = Mock(session_id="session-123")
+        
+        result = asyncio.run(invoke({"resume": True}, context))
+        
+        assert result["status"] == "success"
+        graph_input, config = mock_graph.ainvoke.call_args[0]
+        assert graph_input is None
+        assert config["configurable"]["thread_id"] == "session-123"
+    
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
+    def test_invoke_resume_without_checkpoint_starts_fresh(self, mock_graph):
+        """Test resume falls back to a fresh run when the session has no unfinished checkpoint."""
+        mock_graph.aget_state.return_value = Mock(values={}, next=())
+        mock_graph.ainvoke.return_value = {
+            "sql_query": "SELECT * FROM users",
+            "query_execution_id": "test-id",
+            "athena_status": QueryStatus.SUCCEEDED,
+            "retry_count": 1,
+            "max_retries": 10,
+            "analysis_result": {"total_rows": 1, "summary": "Retrieved 1 rows", "s3_uri": "s3://bucket/test-id.csv"},
+            "error": ""
+        }
+        
+        result = asyncio.run(invoke({"sql_query": "SELECT * FROM users", "resume": True}))
+        
+        assert result["status"] == "success"
+        graph_input = mock_graph.ainvoke.call_args[0][0]
+        assert graph_input["sql_query"] == "SELECT * FROM users"
+    
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
+    def test_invoke_resume_unknown_session_without_sql(self, mock_graph):
+        """Test resume without a checkpoint or SQL errors out instead of running the default query."""
+        mock_graph.aget_state.return_value = Mock(values={}, next=())
+        
+        result = asyncio.run(invoke({"resume": True}, Mock(session_id="missing")))
+        
+        assert result["status"] == "error"
+        assert "missing" in result["error"]
+        mock_graph.ainvoke.assert_not_called()
+    
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
+    def test_entrypoint_returns_orjson_bytes(self, mock_graph):
+        """Test the AgentCore entrypoint returns the invoke() result as orjson bytes."""
+        mock_graph.ainvoke.return_value = {
+            "sql_query": "SELECT * FROM users",
+            "query_execution_id": "test-id",
+            "athena_status": QueryStatus.SUCCEEDED,
+            "retry_count": 1,
+            "max_retries": 10,
+            "analysis_result": {"total_rows": 1, "summary": "Retrieved 1 rows", "s3_uri": "s3://bucket/test-id.csv"},
+            "error": ""
+        }
+        
+        response = asyncio.run(entrypoint({"sql_query": "SELECT * FROM users"}))
+        
+        assert response.media_type == "application/json"
+        body = orjson.loads(response.body)
+        assert body["status"] == "success"
+        assert body["result"]["s3_uri"] == "s3://bucket/test-id.csv"
+    
     def test_create_agent_graph(self):
         """Test that agent graph is created successfully."""
         graph = create_agent_graph()
         assert graph is not None
+        # Compiled once and reused
+        assert create_agent_graph() is graph
     
-    @patch('agentcore_agent.athena_client')
-    @patch('agentcore_agent.graph')
+    @patch('agent_core.athena_client')
+    @patch('agentcore_agent.graph', new_callable=_graph_mock)
     def test_invoke_default_values(self, mock_graph, mock_client):
         """Test invoke uses default values when not provided."""
-        mock_graph.invoke.return_value = {
+        mock_graph.ainvoke.return_value = {
             "sql_query": "SELECT * FROM users LIMIT 10",
             "query_execution_id": "test-id",
-            "athena_status": "SUCCEEDED",
+            "athena_status": QueryStatus.SUCCEEDED,
             "retry_count": 1,
             "max_retries": 20,
-            "analysis_result": {"total_rows": 10, "summary": "Retrieved 10 rows", "data": []},
+            "analysis_result": {"total_rows": 10, "summary": "Retrieved 10 rows", "s3_uri": "s3://bucket/test-id.csv"},
             "error": ""
         }
         
         # Empty payload should use defaults
-        result = invoke({})
+        result = asyncio.run(invoke({}))
         
         assert result["status"] == "success"
         # Verify default max_retries was used
-        call_args = mock_graph.invoke.call_args[0][0]
+        call_args = mock_graph.ainvoke.call_args[0][0]
         assert call_args["max_retries"] == 20
 
 
 class TestAgentCoreIntegration:
     """Integration tests for AgentCore deployment."""
     
-    @patch('agentcore_agent.athena_client')
+    def setup_method(self):
+        import agent_core
+        agent_core._result_cache.clear()
+    
+    @patch('agent_core.athena_client')
+    def test_resume_from_checkpoint(self, mock_client):
+        """Test a retried session resumes from its SQLite checkpoint without resubmitting."""
+        mock_client.ExecuteSQL.return_value = "test-query-id"
+        mock_client.get_query_status.return_value = QueryStatus.RUNNING
+        # The first worker dies mid-wait; the retry picks up after submission
+        mock_client.wait_for_completion = AsyncMock(
+            side_effect=[RuntimeError("worker recycled"), QueryStatus.SUCCEEDED]
+        )
+        mock_client.get_query_results.return_value = iter([{"id": 1, "name": "Alice"}])
+        mock_client.get_output_location.return_value = "s3://bucket/test-query-id.csv"
+        context = Mock(session_id="session-resume")
+        
+        first = asyncio.run(invoke({"sql_query": "SELECT * FROM users", "max_retries": 5}, context))
+        result = asyncio.run(invoke({"resume": True}, context))
+        
+        assert first["status"] == "error"
+        assert result["status"] == "success"
+        assert result["query_id"] == "test-query-id"
+        assert result["result"]["total_rows"] == 1
+        mock_client.ExecuteSQL.assert_called_once()
+    
+    @patch('agent_core.athena_client')
+    def test_resume_finished_session_returns_its_result(self, mock_client):
+        """Test resuming a finished session answers from the checkpoint instead of resubmitting."""
+        mock_client.ExecuteSQL.return_value = "orders-query-id"
+        mock_client.get_query_status.return_value = QueryStatus.SUCCEEDED
+        mock_client.get_query_results.return_value = iter([{"id": 7}])
+        mock_client.get_output_location.return_value = "s3://bucket/orders-query-id.csv"
+        context = Mock(session_id="session-finished")
+        
+        first = asyncio.run(invoke({"sql_query": "SELECT * FROM orders WHERE id = 7"}, context))
+        # The response was lost, so the caller retries with only the resume flag
+        result = asyncio.run(invoke({"resume": True}, context))
+        
+        assert first["status"] == "success"
+        assert result == first
+        mock_client.ExecuteSQL.assert_called_once()
+        assert mock_client.ExecuteSQL.call_args[0][0] == "SELECT * FROM orders WHERE id = 7"
+    
+    @patch('agent_core.athena_client')
     def test_full_workflow_success(self, mock_client):
         """Test complete workflow from submission to results."""
-        from athena_mock import QueryStatus
-        
         # Mock Athena client behavior
         mock_client.ExecuteSQL.return_value = "test-query-id"
-        mock_client.get_query_status.return_value = QueryStatus.SUCCEEDED
-        mock_client.get_query_results.return_value = [
+        mock_client.get_query_status.return_value = QueryStatus.RUNNING
+        mock_client.wait_for_completion = AsyncMock(return_value=QueryStatus.SUCCEEDED)
+        mock_client.get_query_results.return_value = iter([
             {"id": 1, "name": "Alice"},
             {"id": 2, "name": "Bob"}
-        ]
+        ])
+        mock_client.get_output_location.return_value = "s3://bucket/test-query-id.csv"
         
         payload = {
             "sql_query": "SELECT * FROM users",
             "max_retries": 5
         }
         
-        result = invoke(payload)
+        result = asyncio.run(invoke(payload))
         
         assert result["status"] == "success"
         assert result["result"]["total_rows"] == 2
-        assert len(result["result"]["data"]) == 2
+        assert result["result"]["s3_uri"] == "s3://bucket/test-query-id.csv"
+        # One completion wait replaces the polling loop
+        assert result["polls"] == 1
+        mock_client.wait_for_completion.assert_awaited_once()
 
 
 if __name__ == "__main__":